@@ -1,2 +1,13 @@
 TIME_BUDGET = 12 * 3600
-MAX_BUDGET = 10
\ No newline at end of file
+MAX_BUDGET = 10
+
+# SBVA preprocessing policy
+SBVA_MIN_CLAUSES = 2000
+SBVA_MAX_SECONDS = 3
+SBVA_BUDGET_FRACTION = 0.3
+SBVA_MIN_REDUCTION = 0.02
+SBVA_HISTORY_SIZE = 20
+SBVA_PROBE_INTERVAL = 10
+SBVA_CACHE_DIR = 'sbva_cache'
+SBVA_CACHE_MAX_BYTES = 256 * 1024 * 1024
+SBVA_STALE_SECONDS = 3600
@@ -60,7 +60,7 @@ def show_interactive_solver():
         status_text = st.empty()
         status_text.write('Solving for the earliest possible state (this might take a couple minutes)...')
 
-        result, num_iterations = solve_loop(grid, False)
+        result, num_iterations, stats = solve_loop(grid, False)
         status_text.empty()
 
         if result is not None:
@@ -68,6 +68,7 @@ def show_interactive_solver():
             st.success(f"{num_iterations} previous states found.")
             evolution_fig = plot_game_of_life(result, num_transitions=num_iterations + 1, states_per_row=3)
             st.pyplot(evolution_fig)
+            st.caption(f"SBVA cache hit rate: {stats['hit_rate']:.0%}, preprocessing time saved: {stats['seconds_saved']:.2f}s")
         else:
             st.error('No valid initial state found that evolves into the given final state.')
 
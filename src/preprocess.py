@@ -0,0 +1,309 @@
+import os
+import json
+import time
+import hashlib
+import tempfile
+import threading
+import subprocess
+import logging
+from collections import deque
+from constants import *
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Streamlit solves each session in its own thread, so the shared state below is only
+# touched while holding this lock.
+preprocess_lock = threading.Lock()
+
+# (clauses in, seconds, clauses out) for the most recent SBVA runs in this process.
+# Clauses out is None for runs that failed or timed out.
+sbva_history = deque(maxlen=SBVA_HISTORY_SIZE)
+
+# Formulas skipped on history alone since SBVA last ran, used to re-probe SBVA.
+policy_skips = 0
+
+
+
+def new_preprocess_stats():
+    return {
+        'hits': 0,
+        'misses': 0,
+        'skipped': 0,
+        'timeouts': 0,
+        'sbva_seconds': 0.0,
+        'seconds_saved': 0.0,
+    }
+
+
+preprocess_stats = new_preprocess_stats()
+
+
+def count(stats, name, amount=1):
+    """Add to a process-wide counter and, if given, to the caller's own `stats`."""
+    with preprocess_lock:
+        preprocess_stats[name] += amount
+    if stats is not None:
+        stats[name] += amount
+
+
+def split_units(clauses):
+    """Split DIMACS clause lines into the non-unit core and the unit clauses.
+
+    Unit clauses only pin cells (dead neighbourhoods, second-neighbour retries). The
+    core still encodes the live/dead pattern of the puzzle, so it is only shared by the
+    second-neighbour retry of a puzzle or by solving the exact same grid again, not by
+    different grids of the same shape. SBVA keeps the original variable numbering,
+    which makes appending the units after preprocessing sound.
+    """
+    core, units = [], []
+    for line in clauses.splitlines(keepends=True):
+        if len(line.split()) == 2:
+            units.append(line)
+        else:
+            core.append(line)
+    return ''.join(core), ''.join(units)
+
+
+def formula_key(core, nb_vars):
+    return hashlib.sha256(f'{nb_vars}\n{core}'.encode('utf8')).hexdigest()
+
+
+def sbva_time_slice(budget):
+    """SBVA gets its own slice of the solve budget so kissat is never starved."""
+    return min(SBVA_MAX_SECONDS, budget * SBVA_BUDGET_FRACTION)
+
+
+def should_run_sbva(nb_clauses, time_slice):
+    """Decide from past SBVA runs whether preprocessing is worth it.
+
+    Every `SBVA_PROBE_INTERVAL` skips SBVA is run anyway, so the history is refreshed
+    and the policy can recover after a bad stretch.
+    """
+    global policy_skips
+    with preprocess_lock:
+        history, skips = list(sbva_history), policy_skips
+    if not history:
+        return True, "no timing history"
+    if skips >= SBVA_PROBE_INTERVAL:
+        return True, f"re-probing after {skips} skips"
+
+    seconds_per_clause = sum(s / n for n, s, _ in history) / len(history)
+    predicted = seconds_per_clause * nb_clauses
+    reason = None
+    if predicted > time_slice:
+        reason = f"predicted {predicted:.2f}s exceeds {time_slice:.2f}s slice"
+
+    completed = [(n, out) for n, _, out in history if out is not None]
+    if reason is None and len(completed) >= 3:
+        reduction = sum(1 - out / n for n, out in completed) / len(completed)
+        if reduction < SBVA_MIN_REDUCTION:
+            reason = f"average clause reduction {reduction:.1%} too low"
+
+    if reason is not None:
+        with preprocess_lock:
+            policy_skips += 1
+        return False, reason
+    return True, f"predicted {predicted:.2f}s"
+
+
+def read_dimacs(filename):
+    """Return the variable count, clause count and clause body of a DIMACS file."""
+    nb_vars, nb_clauses, body = 0, 0, []
+    with open(filename, 'r') as f:
+        for line in f:
+            if line.startswith('c'):
+                continue
+            if line.startswith('p'):
+                _, _, nb_vars, nb_clauses = line.split()
+                continue
+            body.append(line)
+    return int(nb_vars), int(nb_clauses), ''.join(body)
+
+
+def cache_paths(key):
+    base = os.path.join(SBVA_CACHE_DIR, key)
+    return f'{base}.cnf', f'{base}.json'
+
+
+def load_cache_entry(key):
+    """Return the saved SBVA seconds and the cached DIMACS file, or None on a miss."""
+    cnf_path, meta_path = cache_paths(key)
+    try:
+        with open(meta_path, 'r') as f:
+            seconds = json.load(f)['seconds']
+        dimacs = read_dimacs(cnf_path)
+    except (OSError, ValueError, KeyError):
+        return None
+    return seconds, dimacs
+
+
+def make_temp_file():
+    fd, path = tempfile.mkstemp(dir=SBVA_CACHE_DIR, suffix='.tmp')
+    os.close(fd)
+    return path
+
+
+def remove_quietly(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def evict_cache(keep):
+    """Delete the least recently used cache entries, except `keep`, until the cache fits on disk.
+
+    Temp files and sidecars without a .cnf left behind by a killed process are removed
+    once they are older than `SBVA_STALE_SECONDS`; younger ones may belong to a running
+    solve and only count toward the size limit.
+    """
+    entries, total = [], 0
+    now = time.time()
+    for name in os.listdir(SBVA_CACHE_DIR):
+        path = os.path.join(SBVA_CACHE_DIR, name)
+        try:
+            mtime, size = os.path.getmtime(path), os.path.getsize(path)
+        except FileNotFoundError:
+            continue
+        key, extension = os.path.splitext(name)
+        if extension == '.cnf':
+            entries.append((mtime, key))
+        elif extension == '.tmp' or not os.path.exists(cache_paths(key)[0]):
+            if now - mtime > SBVA_STALE_SECONDS:
+                remove_quietly(path)
+                logger.info(f"Removed stale SBVA cache file {name}.")
+                continue
+        total += size
+
+    sizes = {}
+    for _, key in entries:
+        sizes[key] = sum(os.path.getsize(path) for path in cache_paths(key) if os.path.exists(path))
+    for _, key in sorted(entries):
+        if total <= SBVA_CACHE_MAX_BYTES:
+            break
+        if key == keep:
+            continue
+        for path in cache_paths(key):
+            remove_quietly(path)
+        total -= sizes[key]
+        logger.info(f"Evicted SBVA cache entry {key[:12]}.")
+
+
+def run_sbva(core, nb_vars, nb_clauses, key, time_slice, stats=None):
+    """Run SBVA on the core formula and store the result in the cache.
+
+    Every run works on its own temp files, so concurrent solves cannot mix up their
+    formulas; only the finished entry is moved into place under `key`.
+    Returns False if SBVA failed or did not finish within its time slice.
+    """
+    global policy_skips
+    with preprocess_lock:
+        policy_skips = 0
+
+    core_filename, tmp_path, meta_tmp_path = make_temp_file(), make_temp_file(), make_temp_file()
+    with open(core_filename, 'w') as f:
+        f.write(f'p cnf {nb_vars} {nb_clauses}\n')
+        f.write(core)
+
+    cnf_path, meta_path = cache_paths(key)
+    sbva_start = time.time()
+    try:
+        result = subprocess.run(['SBVA/sbva', '-i', core_filename, '-o', tmp_path], timeout=time_slice)
+    except subprocess.TimeoutExpired:
+        result = None
+    seconds = time.time() - sbva_start
+    count(stats, 'sbva_seconds', seconds)
+    os.remove(core_filename)
+
+    if result is None or result.returncode != 0 or os.path.getsize(tmp_path) == 0:
+        if result is None:
+            count(stats, 'timeouts')
+            logger.info(f"SBVA exceeded its {time_slice:.2f}s slice, using the raw formula.")
+        else:
+            logger.error("SBVA failed, using the raw formula.")
+        with preprocess_lock:
+            sbva_history.append((nb_clauses, seconds, None))
+        remove_quietly(tmp_path)
+        remove_quietly(meta_tmp_path)
+        return False
+
+    _, clauses_out, _ = read_dimacs(tmp_path)
+    with preprocess_lock:
+        sbva_history.append((nb_clauses, seconds, clauses_out))
+    # The sidecar goes in first: a .cnf in the cache always has complete metadata.
+    with open(meta_tmp_path, 'w') as f:
+        json.dump({'seconds': seconds, 'clauses_in': nb_clauses, 'clauses_out': clauses_out}, f)
+    os.replace(meta_tmp_path, meta_path)
+    os.replace(tmp_path, cnf_path)
+
+    logger.info(f"SBVA reduced {nb_clauses} clauses to {clauses_out} in {seconds:.2f}s.")
+    evict_cache(keep=key)
+    return True
+
+
+def preprocess(clauses, nb_vars, budget, filename, file_location='', stats=None):
+    """Return the CNF file kissat should solve, running SBVA only when it pays off.
+
+    The returned path is either the raw `filename` or `preprocessed_puzzle.cnf`, built
+    from the cached SBVA output of the core with the unit clauses appended. Counters
+    are also added to `stats`, if given, so a caller can report on its own solves.
+    """
+    core, units = split_units(clauses)
+    nb_core = core.count('\n')
+    nb_units = units.count('\n')
+
+    # Formulas this small are never cached, so they do not count as cache lookups.
+    if nb_core < SBVA_MIN_CLAUSES:
+        count(stats, 'skipped')
+        logger.info(f"Skipping SBVA: formula too small ({nb_core} clauses).")
+        return filename
+
+    key = formula_key(core, nb_vars)
+    os.makedirs(SBVA_CACHE_DIR, exist_ok=True)
+    entry = load_cache_entry(key)
+
+    if entry is not None:
+        saved = entry[0]
+        try:
+            os.utime(cache_paths(key)[0])
+        except FileNotFoundError:
+            pass
+        count(stats, 'hits')
+        count(stats, 'seconds_saved', saved)
+        logger.info(f"SBVA cache hit {key[:12]}, saved {saved:.2f}s.")
+    else:
+        count(stats, 'misses')
+        time_slice = sbva_time_slice(budget)
+        run, reason = should_run_sbva(nb_core, time_slice)
+        if not run:
+            count(stats, 'skipped')
+            logger.info(f"Skipping SBVA: {reason}.")
+            return filename
+        if not run_sbva(core, nb_vars, nb_core, key, time_slice, stats):
+            return filename
+        entry = load_cache_entry(key)
+        if entry is None:
+            return filename
+
+    sbva_vars, sbva_clauses, body = entry[1]
+    preprocessed_filename = f'{file_location}preprocessed_puzzle.cnf'
+    with open(preprocessed_filename, 'w') as f:
+        f.write(f'p cnf {sbva_vars} {sbva_clauses + nb_units}\n')
+        f.write(body)
+        if body and not body.endswith('\n'):
+            f.write('\n')
+        f.write(units)
+    return preprocessed_filename
+
+
+def get_preprocess_stats(stats=None):
+    """Return a snapshot of `stats`, or of the process-wide counters, including the cache hit rate."""
+    if stats is None:
+        with preprocess_lock:
+            stats = dict(preprocess_stats)
+    else:
+        stats = dict(stats)
+    lookups = stats['hits'] + stats['misses']
+    stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+    return stats
@@ -6,13 +6,14 @@ import argparse
 import logging
 from utils import *
 from constants import *
+from preprocess import preprocess, new_preprocess_stats, get_preprocess_stats
 from setup_project import setup_project
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 
-def solve(puzzle, start_time, second_neighbors=False, keep_cnf=False, file_location=''):
+def solve(puzzle, start_time, second_neighbors=False, keep_cnf=False, file_location='', stats=None):
     """Attempt to solve the Game of Life puzzle using SAT solver."""
     budget = TIME_BUDGET - (time.time() - start_time)
     budget = min(budget, MAX_BUDGET)
@@ -30,13 +31,13 @@ def solve(puzzle, start_time, second_neighbors=False, keep_cnf=False, file_locat
         f.write(f'p cnf {W*H} {nb}\n')
         f.write(clauses)
 
-    preprocessed_filename = f'{file_location}preprocessed_puzzle.cnf'
-    subprocess.run(['SBVA/sbva', '-i', filename, '-o', preprocessed_filename])
+    preprocessed_filename = preprocess(clauses, W*H, budget, filename, file_location=file_location, stats=stats)
     solution = subprocess.run(["./kissat/build/kissat", "-q", preprocessed_filename], stdout=subprocess.PIPE).stdout.decode('utf8')
 
     if not keep_cnf:
         os.remove(filename)
-        os.remove(preprocessed_filename)
+        if preprocessed_filename != filename:
+            os.remove(preprocessed_filename)
 
     if solution == '' or 'UNSAT' in solution:
         logger.info("Puzzle is UNSAT")
@@ -61,26 +62,33 @@ def parse_solution(solution, W, H):
 def solve_loop(initial_state, keep_cnf, file_location=''):
     state, prev_state = initial_state, None
     start_time, max_iterations = time.time(), 100
+    stats = new_preprocess_stats()
 
     for iteration_count in range(max_iterations):
         prev_state = state
         state = solve(puzzle=prev_state, 
                       start_time=start_time, 
                       keep_cnf=keep_cnf,
-                      file_location=file_location)
+                      file_location=file_location,
+                      stats=stats)
         
         if state is None or not np.any(state):
             state = solve(puzzle=prev_state, 
                           start_time=start_time, 
                           second_neighbors=True, 
                           keep_cnf=keep_cnf,
-                          file_location=file_location)
+                          file_location=file_location,
+                          stats=stats)
             if state is None:
                 break
     
     logger.info(f"Found {iteration_count} previous states.")
+
+    stats = get_preprocess_stats(stats)
+    logger.info(f"SBVA cache hit rate {stats['hit_rate']:.0%} ({stats['hits']} hits, {stats['misses']} misses, "
+                f"{stats['skipped']} skipped, {stats['timeouts']} timeouts), {stats['seconds_saved']:.2f}s saved.")
     
-    return prev_state, iteration_count
+    return prev_state, iteration_count, stats
     
 
 def main():
@@ -117,7 +125,7 @@ def main():
         logger.error("No puzzle file or word provided. Please specify one.")
         return
 
-    prev_state, iteration_count = solve_loop(initial_state, args.keep_cnf)
+    prev_state, iteration_count, _ = solve_loop(initial_state, args.keep_cnf)
 
     if prev_state is not None:
         save_state(prev_state, iteration_count)